@@ -1,35 +1,100 @@
-import os, json, sys, re
+import os, sys, re, time, tempfile, hashlib, threading, asyncio
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict
+from typing import TYPE_CHECKING, Any, Callable, Dict
+
+import orjson
 
-# NEW SDK
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
-import os
+
+# NEW SDK -- imported lazily below; it's the bulk of startup time and
+# cache hits / empty input / --help never touch it
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
 
 # Load .env file
 load_dotenv()
 
-# Fetch key
+# Fetch key once; get_client() refuses to run without it
 api_key = os.getenv("GEMINI_API_KEY")
 
+def _new_client() -> "genai.Client":
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY must be set (environment or .env)")
+    from google import genai
+    return genai.Client(api_key=api_key)
+
+# one client per process so the HTTP connection pool is reused across calls.
+# its async (.aio) pool binds to the first event loop that uses it, so
+# parse_resumes builds its own client per run instead
+@lru_cache(maxsize=1)
+def get_client() -> "genai.Client":
+    return _new_client()
+
+async def _aclose(client: "genai.Client") -> None:
+    # older google-genai releases have no aclose; their pool just gets GC'd
+    aclose = getattr(client.aio, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+# strips ```json fences the model sometimes wraps around its output
+def _strip_fences(s: str) -> str:
+    s = s.strip()
+    # JSON mode shouldn't fence at all; warn so we know if this can be dropped
+    if not (s.startswith("```") or s.endswith("```")):
+        return s
+    print("⚠️ Gemini fenced its JSON reply despite JSON mode; stripping", file=sys.stderr)
+    if s.startswith("```json"):
+        s = s[7:].lstrip()
+    elif s.startswith("```"):
+        s = s[3:].lstrip()
+    if s.endswith("```"):
+        s = s[:-3].rstrip()
+    return s
+
+# bullets -> "- ", en dash -> "-", fancy quotes -> plain, in one pass
+_PRECLEAN_TABLE = str.maketrans({
+    "•": "- ",
+    "●": "- ",
+    "–": "-",
+    "\u2018": "'",
+    "\u2019": "'",
+    "\u201c": '"',
+    "\u201d": '"',
+})
+_TRAILING_WS_RE = re.compile(r"[ \t]+\n")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+# fallback when the reply has chatter around the JSON: first "{" to last "}"
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.S)
+
 # ---- tiny cleaner to reduce LLM guesswork
 def preclean(text: str) -> str:
     # normalize bullets, collapse whitespace, strip fancy quotes
-    t = text.replace("•", "- ").replace("●", "- ").replace("–", "-")
-    t = re.sub(r"[ \t]+\n", "\n", t)
-    t = re.sub(r"\n{3,}", "\n\n", t)
-    t = t.replace("\u2018", "'").replace("\u2019", "'").replace("\u201c", '"').replace("\u201d", '"')
+    t = text.translate(_PRECLEAN_TABLE)
+    t = _TRAILING_WS_RE.sub("\n", t)
+    t = _BLANK_LINES_RE.sub("\n\n", t)
     return t.strip()
 
+# every byte except a-z, for bytes.translate deletion
+_NON_LOWER_ASCII = bytes(c for c in range(256) if not 0x61 <= c <= 0x7A)
+
+def normalize_alpha(text: str) -> str:
+    # lowercase and keep only a-z, so "Hashim  KHAN" matches "hashimkhan"
+    return text.lower().encode("ascii", "ignore").translate(None, _NON_LOWER_ASCII).decode("ascii")
+
+def read_resume_text(path: Path) -> str:
+    # one C-level decode instead of TextIOWrapper; CRLF and bare CR folded to "\n"
+    # like universal newlines, so preclean's patterns still match
+    return path.read_bytes().decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+
 # ---- simple sanity check: don't trust hallucinated names
-def wipe_if_not_in_source(value: str | None, source: str) -> str | None:
+def wipe_if_not_in_source(value: str | None, source: str, already_normalized: bool = False) -> str | None:
     if not value:
         return value
-    v = re.sub(r"[^a-z]", "", value.lower())
-    s = re.sub(r"[^a-z]", "", source.lower())
-    return value if v in s else None
+    s = source if already_normalized else normalize_alpha(source)
+    return value if normalize_alpha(value) in s else None
 
 # ---- JSON Schema for structured output (strict)
 RESUME_SCHEMA: Dict[str, Any] = {
@@ -114,6 +179,18 @@ RESUME_SCHEMA: Dict[str, Any] = {
         "languages": {"type": "ARRAY", "items": {"type": "STRING"}},
         "awards": {"type": "ARRAY", "items": {"type": "STRING"}},
     },
+    # emit the core sections first so they aren't the tail of a long generation
+    "propertyOrdering": [
+        "contact_info",
+        "summary",
+        "work_experience",
+        "education",
+        "skills",
+        "certifications",
+        "projects",
+        "languages",
+        "awards",
+    ],
     # make top-level fields present; allow nulls/empties inside
     "required": [
         "contact_info",
@@ -130,58 +207,332 @@ SYSTEM_INSTRUCTION = (
     "Dates should be 'YYYY' or 'YYYY-MM'. If a section does not exist, return an empty array/object."
 )
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python gemini_parser.py path/to/sample.txt")
-        sys.exit(1)
-
-    src_path = Path(sys.argv[1])
-    text = preclean(src_path.read_text(encoding="utf-8", errors="ignore"))
-
-    client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-
-    # Use the model you asked for; stick to 1.5 Flash for cost/speed
-    model_name = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
-
-    config = types.GenerateContentConfig(
+# immutable, so build it once instead of per call
+@lru_cache(maxsize=1)
+def get_parse_config() -> "types.GenerateContentConfig":
+    from google.genai import types
+    return types.GenerateContentConfig(
         temperature=0.0,
         response_mime_type="application/json",
         response_schema=RESUME_SCHEMA,
         system_instruction=SYSTEM_INSTRUCTION,
     )
 
-    prompt = (
+# shorter (precleaned) input can't hold a resume; see parse_resume
+MIN_TEXT_CHARS = 10
+
+# parsed results keyed by a hash of the precleaned text (+ model, schema); unchanged resumes skip the LLM
+CACHE_DIR = Path(os.environ.get("CV_CACHE_DIR", ".cv_cache"))
+
+def build_prompt(text: str) -> str:
+    return (
         "Parse the following resume-like text into the JSON schema. "
         "If the person is a surgical technician or similar, capture clinical skills accurately.\n\n"
         f"=== START TEXT ===\n{text}\n=== END TEXT ==="
     )
 
-    resp = client.models.generate_content(model=model_name, contents=prompt, config=config)
+# schema/instruction/prompt changes must not serve results shaped by the old ones
+_SCHEMA_FINGERPRINT = hashlib.blake2b(
+    orjson.dumps([RESUME_SCHEMA, SYSTEM_INSTRUCTION, build_prompt("")], option=orjson.OPT_SORT_KEYS),
+    digest_size=8,
+).digest()
 
-    # SDK returns JSON text when response_mime_type=application/json
-    raw = resp.text.strip()
+def _cache_path(text: str, model_name: str) -> Path:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(_SCHEMA_FINGERPRINT)
+    h.update(model_name.encode("utf-8") + b"\0")
+    h.update(text.encode("utf-8"))
+    return CACHE_DIR / f"{h.hexdigest()}.json"
+
+# batch jobs finish asynchronously (up to 24h); these are terminal states
+_BATCH_DONE_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+}
 
+def load_response_json(raw: str, text: str) -> Dict[str, Any]:
+    """Decode the model's JSON reply and drop a name that isn't in `text`."""
     # belts & suspenders: strip backticks if any slipped in
-    raw = re.sub(r"^```json\s*|\s*```$", "", raw)
+    raw = _strip_fences(raw)
 
     try:
-        parsed = json.loads(raw)
-    except json.JSONDecodeError:
+        parsed = orjson.loads(raw)
+    except orjson.JSONDecodeError:
         # fallback: try to extract the first {...} block
-        m = re.search(r"\{.*\}", raw, flags=re.S)
+        m = _JSON_OBJECT_RE.search(raw)
         if not m:
-            print("❌ Could not find JSON in response. Raw below:\n", raw[:1000])
-            sys.exit(2)
-        parsed = json.loads(m.group(0))
+            raise ValueError(f"Could not find JSON in response. Raw below:\n{raw[:1000]}")
+        parsed = orjson.loads(m.group(0))
 
     # sanity check: don't keep names that aren't in the source text
+    source_norm = normalize_alpha(text)
     ci = parsed.get("contact_info", {}) or {}
-    ci["name"] = wipe_if_not_in_source(ci.get("name"), text)
+    ci["name"] = wipe_if_not_in_source(ci.get("name"), source_norm, already_normalized=True)
     parsed["contact_info"] = ci
+    return parsed
+
+def _empty_resume() -> Dict[str, Any]:
+    parsed = {key: {} if RESUME_SCHEMA["properties"][key]["type"] == "OBJECT" else []
+              for key in RESUME_SCHEMA["required"]}
+    # same shape as model-backed results, which always carry contact_info.name
+    parsed["contact_info"] = {"name": None}
+    return parsed
+
+def _cache_load(text: str, model_name: str) -> Dict[str, Any] | None:
+    cache_path = _cache_path(text, model_name)
+    if cache_path.exists():
+        return orjson.loads(cache_path.read_bytes())
+    return None
+
+def _cached_or_empty(text: str, model_name: str) -> Dict[str, Any] | None:
+    """Result that needs no LLM call (too-short input or cache hit), else None."""
+    # nothing worth sending: skip the client, cache and LLM round trip entirely
+    if len(text) < MIN_TEXT_CHARS:
+        return _empty_resume()
+    return _cache_load(text, model_name)
+
+def _cache_store(text: str, model_name: str, parsed: Dict[str, Any]) -> None:
+    cache_path = _cache_path(text, model_name)
+    # write-then-rename so concurrent parses never see a half-written entry
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(orjson.dumps(parsed))
+    os.replace(tmp_path, cache_path)
+
+def _model_name() -> str:
+    # Use the model you asked for; stick to 1.5 Flash for cost/speed
+    return os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+
+def _batch_model_name() -> str:
+    return os.environ.get("GEMINI_BATCH_MODEL", "gemini-2.5-flash")
+
+def parse_resume(text: str) -> Dict[str, Any]:
+    """Parse precleaned resume text into a dict matching RESUME_SCHEMA."""
+    model_name = _model_name()
+    parsed = _cached_or_empty(text, model_name)
+    if parsed is not None:
+        return parsed
+
+    resp = get_client().models.generate_content(model=model_name, contents=build_prompt(text), config=get_parse_config())
 
+    # SDK returns JSON text when response_mime_type=application/json
+    parsed = load_response_json(resp.text, text)
+    _cache_store(text, model_name, parsed)
+    return parsed
+
+async def parse_resume_async(
+    text: str, sem: asyncio.Semaphore, client_factory: Callable[[], "genai.Client"] = get_client
+) -> Dict[str, Any]:
+    """Async twin of parse_resume; `sem` bounds in-flight Gemini requests.
+
+    `client_factory` must return a client whose .aio pool belongs to the
+    running event loop; the shared get_client() is only safe if every call
+    happens on one long-lived loop.
+    """
+    model_name = _model_name()
+    parsed = _cached_or_empty(text, model_name)
+    if parsed is not None:
+        return parsed
+
+    async with sem:
+        resp = await client_factory().aio.models.generate_content(
+            model=model_name, contents=build_prompt(text), config=get_parse_config()
+        )
+
+    parsed = load_response_json(resp.text, text)
+    _cache_store(text, model_name, parsed)
+    return parsed
+
+def _write_parsed(src_path: Path, parsed: Dict[str, Any]) -> Path:
     out_path = src_path.with_suffix(".parsed.json")
-    out_path.write_text(json.dumps(parsed, indent=2, ensure_ascii=False), encoding="utf-8")
-    print(f"✅ Parsed JSON saved to: {out_path}")
+    out_path.write_bytes(orjson.dumps(parsed, option=orjson.OPT_INDENT_2))
+    return out_path
+
+def parse_resumes_batch(paths: list[Path], poll_seconds: float = 30.0) -> Dict[Path, Path]:
+    """Parse many resumes through one Gemini Batch job (half price, async).
+
+    Writes each result next to its source as .parsed.json and returns a
+    {source: output} map. Cached and too-short resumes are written without
+    being submitted; resumes the job reports an error for are skipped.
+    """
+    model_name = _batch_model_name()
+    texts = {str(p): preclean(read_resume_text(p)) for p in paths}
+
+    results: Dict[Path, Path] = {}
+    pending: Dict[str, str] = {}
+    for key, text in texts.items():
+        parsed = _cached_or_empty(text, model_name)
+        if parsed is not None:
+            results[Path(key)] = _write_parsed(Path(key), parsed)
+        else:
+            pending[key] = text
+
+    # nothing left to bill (no paths, or all cached): skip the upload and job
+    if not pending:
+        return results
+
+    client = get_client()
+    with tempfile.NamedTemporaryFile("wb", suffix=".jsonl", delete=False) as f:
+        for key, text in pending.items():
+            line = {
+                "key": key,
+                "request": {
+                    "contents": [{"role": "user", "parts": [{"text": build_prompt(text)}]}],
+                    "system_instruction": {"parts": [{"text": SYSTEM_INSTRUCTION}]},
+                    "generation_config": {
+                        "temperature": 0.0,
+                        "response_mime_type": "application/json",
+                        "response_schema": RESUME_SCHEMA,
+                    },
+                },
+            }
+            f.write(orjson.dumps(line) + b"\n")
+        batch_file = Path(f.name)
+
+    try:
+        uploaded = client.files.upload(
+            file=str(batch_file),
+            config={"display_name": "resume_batch", "mime_type": "jsonl"},
+        )
+    finally:
+        batch_file.unlink()
+
+    job = client.batches.create(model=model_name, src=uploaded.name, config={"display_name": "resume_batch"})
+    print(f"⏳ Submitted batch job {job.name} ({len(pending)} resumes)")
+    while job.state.name not in _BATCH_DONE_STATES:
+        time.sleep(poll_seconds)
+        job = client.batches.get(name=job.name)
+
+    if job.state.name != "JOB_STATE_SUCCEEDED":
+        raise RuntimeError(f"Batch job {job.name} ended in {job.state.name}: {job.error}")
+
+    for line in client.files.download(file=job.dest.file_name).decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        item = orjson.loads(line)
+        key = item["key"]
+        if "response" not in item:
+            print(f"❌ {key}: {item.get('error')}")
+            continue
+        try:
+            # a blocked prompt comes back with promptFeedback and no candidates
+            raw = item["response"]["candidates"][0]["content"]["parts"][0]["text"]
+            parsed = load_response_json(raw, pending[key])
+        except (KeyError, IndexError) as e:
+            print(f"❌ {key}: no text in batch response ({e!r})")
+            continue
+        except ValueError as e:
+            print(f"❌ {key}: {e}")
+            continue
+        _cache_store(pending[key], model_name, parsed)
+        src_path = Path(key)
+        results[src_path] = _write_parsed(src_path, parsed)
+    return results
+
+def parse_file(src_path: Path) -> Path:
+    """Parse one resume file and write <name>.parsed.json next to it."""
+    return _write_parsed(src_path, parse_resume(preclean(read_resume_text(src_path))))
+
+async def _parse_file_async(
+    src_path: Path, sem: asyncio.Semaphore, client_factory: Callable[[], "genai.Client"]
+) -> Path:
+    text = preclean(read_resume_text(src_path))
+    return _write_parsed(src_path, await parse_resume_async(text, sem, client_factory))
+
+def parse_resumes(paths: list[Path], max_concurrency: int = 8) -> Dict[Path, Path | BaseException]:
+    """Parse many resumes concurrently; maps each source to its output or the error it raised."""
+    if max_concurrency < 1:
+        # Semaphore(0) would never let a request through and hang forever
+        raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
+
+    async def run() -> list[Path | BaseException]:
+        sem = asyncio.Semaphore(max_concurrency)
+        # asyncio.run gives every call a fresh loop, so the client (and its
+        # async connection pool) must live and die with this run; built lazily
+        # so all-cached/empty runs never need an API key
+        client = None
+
+        def loop_client() -> "genai.Client":
+            nonlocal client
+            if client is None:
+                client = _new_client()
+            return client
+
+        try:
+            return await asyncio.gather(
+                *(_parse_file_async(p, sem, loop_client) for p in paths), return_exceptions=True
+            )
+        finally:
+            if client is not None:
+                await _aclose(client)
+
+    return dict(zip(paths, asyncio.run(run())))
+
+def collect_paths(args: list[str]) -> list[Path]:
+    # directories expand to the .txt resumes directly inside them
+    paths: list[Path] = []
+    for a in args:
+        p = Path(a)
+        paths.extend(sorted(p.glob("*.txt")) if p.is_dir() else [p])
+    return paths
+
+USAGE = (
+    "Usage: python gemini_parser.py path/to/sample.txt [more.txt | resumes_dir ...]\n"
+    "       python gemini_parser.py --batch a.txt b.txt ..."
+)
+
+def _collect_or_exit(args: list[str]) -> list[Path]:
+    # an empty dir (or bare --batch) would otherwise "succeed" having done nothing
+    paths = collect_paths(args)
+    if not paths:
+        print("❌ No .txt resumes found." if args else USAGE)
+        sys.exit(1)
+    return paths
+
+def main():
+    if len(sys.argv) < 2:
+        print(USAGE)
+        sys.exit(1)
+
+    if sys.argv[1] in ("-h", "--help"):
+        print(USAGE)
+        return
+
+    if sys.argv[1] == "--batch":
+        paths = _collect_or_exit(sys.argv[2:])
+        done = parse_resumes_batch(paths)
+        for out_path in done.values():
+            print(f"✅ Parsed JSON saved to: {out_path}")
+        if len(done) < len(set(paths)):
+            sys.exit(2)
+        return
+
+    paths = _collect_or_exit(sys.argv[1:])
+    if len(paths) == 1:
+        try:
+            out_path = parse_file(paths[0])
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(2)
+        print(f"✅ Parsed JSON saved to: {out_path}")
+        return
+
+    # each parse is one network-bound Gemini call, so overlap the waits
+    max_concurrency = int(os.environ.get("PARSER_MAX_WORKERS", "8"))
+    failed = False
+    for src_path, result in parse_resumes(paths, max_concurrency).items():
+        if isinstance(result, Exception):
+            # API errors, missing files, bad JSON: report and keep going
+            print(f"❌ {src_path}: {result}")
+            failed = True
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            print(f"✅ Parsed JSON saved to: {result}")
+    if failed:
+        sys.exit(2)
 
 if __name__ == "__main__":
     main()